@@ -4,27 +4,272 @@
 Módulo central para extração de dados e geração de documentos.
 """
 
+import os
 import re
+import io
+import copy
+import mmap
+import hashlib
+import tempfile
+import threading
 import fitz
-import spacy
 import json
+from collections import OrderedDict
 from io import BytesIO
 from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Emu
+from lxml.etree import SubElement
+from docxtpl import DocxTemplate
 import datetime
-import openpyxl
-from typing import Dict, Any, Optional
-from flask import render_template
-from weasyprint import HTML
-
+import xlsxwriter
+from typing import IO, Dict, Any, List, Optional, Union
 try:
-    nlp = spacy.load("pt_core_news_md")
-    print("[INFO] Modelo de NLP (pt_core_news_md) carregado com sucesso.")
-except OSError:
-    print("[AVISO] Modelo 'pt_core_news_md' não foi encontrado. Execute: python -m spacy download pt_core_news_md")
-    nlp = None
-
-def extrair_dados_do_contrato_por_tipo(pdf_bytes: bytes, tipo_analise: str = 'padrao') -> Optional[Dict[str, Any]]:
-    texto = _extrair_texto_de_pdf_bytes(pdf_bytes)
+    # RE2 (google-re2) garante tempo linear: usado na leitura das linhas de
+    # produtos, onde um PDF malformado poderia levar o 're' a backtracking caro.
+    import re2 as _re_linear
+except ImportError:
+    print("[AVISO] Pacote 'google-re2' não encontrado; usando 're' na tabela de produtos. Execute: pip install google-re2")
+    _re_linear = re
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+
+# Apenas as entidades (doc.ents) são usadas na extração, então os componentes
+# mais lentos do pipeline (parser, tagger, etc.) não são carregados.
+_SPACY_COMPONENTES_DESATIVADOS = ["parser", "tagger", "morphologizer", "attribute_ruler", "lemmatizer"]
+
+# O modelo só é carregado no primeiro uso do modo 'padrao' (NLP). Workers que
+# atendem apenas o modo 'sistema' (Regex) nunca pagam o custo de memória e de
+# inicialização do spaCy.
+nlp = None
+_matcher = None
+_nlp_lock = threading.Lock()
+
+def _get_nlp():
+    global nlp, _matcher
+    if nlp is None:
+        with _nlp_lock:
+            if nlp is None:
+                try:
+                    import spacy
+                    from spacy.matcher import Matcher
+                    modelo = spacy.load("pt_core_news_md", disable=_SPACY_COMPONENTES_DESATIVADOS)
+                    _matcher = Matcher(modelo.vocab)
+                    for rotulo, padroes in _PADROES_MATCHER.items():
+                        # VALOR_TOTAL fica sem 'greedy': cada início tem uma só ocorrência
+                        # possível, e o LONGEST poderia trocar uma ocorrência válida por
+                        # outra mais longa que depois é descartada pela janela.
+                        _matcher.add(rotulo, padroes, greedy=None if rotulo == "VALOR_TOTAL" else "LONGEST")
+                    nlp = modelo
+                    print("[INFO] Modelo de NLP (pt_core_news_md) carregado com sucesso.")
+                except OSError:
+                    print("[AVISO] Modelo 'pt_core_news_md' não foi encontrado. Execute: python -m spacy download pt_core_news_md")
+    return nlp
+
+# Tamanho do lote usado no nlp.pipe; configurável por variável de ambiente.
+_SPACY_BATCH_SIZE = int(os.getenv("CONTRATO_SPACY_BATCH", "32"))
+
+# Versão da saída da extração. Entra no nome dos arquivos do cache em disco, para
+# que resultados gravados por uma versão anterior do extrator não continuem sendo
+# servidos após um deploy. Incrementar sempre que uma mudança alterar os dados
+# extraídos (regexes, padrões do Matcher, campos do dicionário, etc.).
+VERSAO_EXTRACAO = 1
+
+class CacheExtracao:
+    """
+    Cache dos dados extraídos, indexado por (sha256 do PDF, tipo_analise).
+    Evita repetir PyMuPDF + Regex/NLP quando o mesmo contrato é reenviado.
+    Fica em memória (LRU); se CACHE_DIR estiver definido, também é gravado
+    em disco como JSON e sobrevive a reinícios do servidor (um arquivo por
+    VERSAO_EXTRACAO; os de versões anteriores são ignorados). O disco guarda no
+    máximo 'max_arquivos' JSONs: ao passar disso, os usados há mais tempo saem.
+    """
+
+    def __init__(self, max_itens: int = 256, cache_dir: Optional[str] = None, max_arquivos: int = 4096):
+        self.max_itens = max_itens
+        self.cache_dir = cache_dir
+        self.max_arquivos = max_arquivos
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def calcular_digest(pdf: Union[bytes, IO[bytes]]) -> str:
+        if isinstance(pdf, (bytes, bytearray)):
+            return hashlib.sha256(pdf).hexdigest()
+        # Stream (ex: request.files['file'].stream): lido em partes e devolvido
+        # ao início, para que a extração possa usá-lo em seguida.
+        sha256 = hashlib.sha256()
+        while parte := pdf.read(64 * 1024):
+            sha256.update(parte)
+        pdf.seek(0)
+        return sha256.hexdigest()
+
+    def get(self, chave) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                return copy.deepcopy(self._itens[chave])
+
+        caminho = self._caminho(chave)
+        if caminho and os.path.exists(caminho):
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    dados = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[AVISO] Falha ao ler cache de extração em disco: {e}")
+                return None
+            try:
+                os.utime(caminho)  # marca o uso, para a poda por data de modificação
+            except OSError:
+                pass
+            self._guardar_em_memoria(chave, dados)
+            return copy.deepcopy(dados)
+        return None
+
+    def set(self, chave, dados: Dict[str, Any]) -> None:
+        self._guardar_em_memoria(chave, copy.deepcopy(dados))
+        caminho = self._caminho(chave)
+        if caminho:
+            try:
+                with open(caminho, 'w', encoding='utf-8') as f:
+                    json.dump(dados, f, ensure_ascii=False)
+            except OSError as e:
+                print(f"[AVISO] Falha ao gravar cache de extração em disco: {e}")
+                return
+            self._podar_disco()
+
+    def _podar_disco(self) -> None:
+        try:
+            with os.scandir(self.cache_dir) as entradas:
+                arquivos = [(e.stat().st_mtime, e.path) for e in entradas if e.name.endswith('.json')]
+        except OSError as e:
+            print(f"[AVISO] Falha ao listar cache de extração em disco: {e}")
+            return
+        excesso = len(arquivos) - self.max_arquivos
+        if excesso <= 0:
+            return
+        arquivos.sort()
+        for _, caminho in arquivos[:excesso]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass  # outro worker pode já ter removido o arquivo
+
+    def _guardar_em_memoria(self, chave, dados: Dict[str, Any]) -> None:
+        with self._lock:
+            self._itens[chave] = dados
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def _caminho(self, chave) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        digest, tipo_analise = chave
+        tipo_seguro = re.sub(r'[^\w-]', '_', tipo_analise)
+        return os.path.join(self.cache_dir, f"{digest}_{tipo_seguro}_v{VERSAO_EXTRACAO}.json")
+
+cache_extracao = CacheExtracao(
+    max_itens=int(os.getenv("CONTRATO_CACHE_TAMANHO", "256")),
+    cache_dir=os.getenv("CACHE_DIR") or None,
+    max_arquivos=int(os.getenv("CONTRATO_CACHE_TAMANHO_DISCO", "4096")),
+)
+
+# Expressões regulares compiladas uma única vez na importação do módulo,
+# evitando o custo de compilação/consulta ao cache do 're' a cada contrato.
+_FLAGS = re.DOTALL | re.IGNORECASE
+
+# --- Modo 'sistema' (contratos gerados pelo próprio sistema) ---
+# Pontas das seções fatiadas por '_fatiar_secao' (mesmos marcadores e flags das
+# regexes originais, só que sem a ponte '[\s\S]*?' entre elas).
+_RE_INICIO_CONTRATANTE = re.compile(r"CONTRATANTE:\s*Sr\(a\)", _FLAGS)
+_RE_FIM_CONTRATANTE = re.compile(r"CONTRATADO:", _FLAGS)
+_RE_INICIO_PRODUTOS = re.compile(r"CLÁUSULA 1 - PRODUTOS CONTRATADOS", _FLAGS)
+_RE_FIM_PRODUTOS = re.compile(r"TOTAL:\s*R\$", _FLAGS)
+_RE_NOME = re.compile(r"^\s*(.*?),\s*brasileiro", _FLAGS)
+_RE_RG = re.compile(r"RG:\s*([\d.\s-]+?)\s*e", _FLAGS)
+_RE_CPF = re.compile(r"CPF:\s*([\d.\s-]+?),", _FLAGS)
+_RE_ENDERECO = re.compile(r"domiciliado\(a\) na\s*(.*?)\s*-\s*Tel\.", _FLAGS)
+_RE_TELEFONE = re.compile(r"Tel\.\s*([\d\(\)\s-]+?)\.", _FLAGS)
+_RE_EMAIL = re.compile(r"E-\s*mail:\s*([\w.%+-]+@[\w.-]+\.[a-zA-Z]{2,})", _FLAGS)
+# O '\s' do RE2 só reconhece espaços ASCII; a classe abaixo inclui os espaços
+# Unicode que o '\s' do 're' também aceita (ex: o espaço não separável U+00A0,
+# comum entre "R$" e o valor), para que nenhuma linha de produto se perca.
+_ESPACO = "[\\s\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]"
+_RE_ITENS = _re_linear.compile(
+    rf'(\d+){_ESPACO}+(.*?){_ESPACO}+R\$'
+    rf'{_ESPACO}*([\d.,]+){_ESPACO}+R\${_ESPACO}*([\d.,]+)'
+)
+# Campos avulsos do contrato reunidos numa única alternância com grupos nomeados:
+# o texto é percorrido uma só vez com finditer e cada ocorrência é despachada
+# pelo 'm.lastgroup', em vez de uma varredura completa por campo. Depois de cada
+# rótulo só se aceita espaço na mesma linha ([ \t]*): com um valor em branco, um
+# '\s*' atravessaria a quebra de linha e a ocorrência consumiria a linha do campo
+# seguinte, que a alternância não teria mais como encontrar.
+_RE_CAMPOS = re.compile(
+    r"(?P<evento>O evento acontecerá no dia:\s*(?P<data_evt>[\d/]+)\s*-\s*Local do evento:[ \t]*(?P<local_evt>.*?)\n)"
+    r"|(?P<como_conheceu>Como nos conheceu:[ \t]*(?P<origem>.*?)\n)",
+    _FLAGS
+)
+# Campos buscados cada um com sua própria regex (e não na alternância acima):
+# o "(.*?)\." do pagamento, por exemplo, pode se estender por várias linhas se
+# faltar o ponto final, e numa alternância esconderia os campos seguintes.
+_RE_VALOR_TOTAL = re.compile(r"TOTAL:\s*(R\$\s*[\d.,]+)", _FLAGS)
+_RE_PAGAMENTO = re.compile(r"foram\s+pagos\s+no\s+dia\s+([\d/]+)\s+(.*?)\.", _FLAGS)
+_RE_RESPONSAVEL = re.compile(r"RESPONSÁVEL PELO CONTRATO:\s*(.*?)\s*\n", _FLAGS)
+
+# --- Modo 'padrao' (NLP) ---
+# Padrões do spaCy Matcher: rodam sobre o Doc já tokenizado pelo nlp.pipe, no
+# lugar de novas varreduras do texto bruto com regex. Com o rótulo separado do
+# valor, o tokenizador quebra o CPF em "123.456." + "789-00" e o telefone
+# "(11) 91234-5678" em "(", "11", ")", "91234-5678", por isso há variantes em
+# mais de um token ("SPACY": False = sem espaço entre eles).
+_VALOR_TOTAL_JANELA = 40
+_PADROES_MATCHER = {
+    "CPF": [
+        [{"TEXT": {"REGEX": r"^\d{3}\.\d{3}\.\d{3}-\d{2}$"}}],
+        [{"TEXT": {"REGEX": r"^\d{3}\.\d{3}\.$"}, "SPACY": False}, {"TEXT": {"REGEX": r"^\d{3}-\d{2}$"}}],
+    ],
+    "TELEFONE": [
+        [{"ORTH": "(", "OP": "?"}, {"TEXT": {"REGEX": r"^\d{2}$"}}, {"ORTH": ")", "OP": "?"}, {"TEXT": {"REGEX": r"^\d{4,5}-?\d{4}$"}}],
+        [{"TEXT": {"REGEX": r"^\(?\d{2}\)?\d{4,5}-?\d{4}$"}}],
+    ],
+    "EMAIL": [
+        [{"LIKE_EMAIL": True}],
+    ],
+    # "valor total"/"preço final" seguido do primeiro "R$ <valor>". O limite de
+    # _VALOR_TOTAL_JANELA tokens entre eles é aplicado em '_montar_dados_nlp': um
+    # "OP": "{0,40}" faz o Matcher crescer exponencialmente (em tempo e memória)
+    # com o número de tokens no intervalo, enquanto "*" é linear.
+    "VALOR_TOTAL": [
+        [{"LOWER": {"IN": ["valor", "preço"]}}, {"LOWER": {"IN": ["total", "final"]}},
+         {"ORTH": {"NOT_IN": ["R$"]}, "OP": "*"}, {"ORTH": "R$"}, {"TEXT": {"REGEX": r"^[\d.,]+$"}}],
+    ],
+    "DATA_EVENTO": [
+        [{"LOWER": "data"}, {"LOWER": "do"}, {"LOWER": "evento"}, {"ORTH": ":", "OP": "?"}, {"SHAPE": "dd/dd/dddd"}],
+    ],
+}
+
+# Quando o valor vem colado ao rótulo, o tokenizador não os separa
+# ("CPF:123.456.789-00" vira "CPF:123.456." + "789-00", "(11)91234-5678" vira
+# "(", "11)", "91234-5678", "e-mail:joao@x.com" fica num token só) e os padrões
+# acima não casam. Para os rótulos que o Matcher não achou, vale a regex
+# original sobre o texto do Doc.
+_RE_NLP_RESERVA = {
+    "CPF": re.compile(r"(\d{3}\.\d{3}\.\d{3}-\d{2})"),
+    "TELEFONE": re.compile(r"(\(?\d{2}\)?\s*\d{4,5}-?\d{4})"),
+    "EMAIL": re.compile(r"([\w.\-]+@[\w.\-]+)"),
+    "VALOR_TOTAL": re.compile(r"(?:valor\s*total|preço\s*final)[\s\S]{0,200}?(R\$\s*[\d.,]+)", re.IGNORECASE),
+    "DATA_EVENTO": re.compile(r"data\s*do\s*evento[:\s]*(\d{2}/\d{2}/\d{4})", re.IGNORECASE),
+}
+
+def extrair_dados_do_contrato_por_tipo(pdf: Union[bytes, IO[bytes]], tipo_analise: str = 'padrao') -> Optional[Dict[str, Any]]:
+    paginas = _extrair_texto_de_pdf(pdf, por_pagina=True)
+    texto = "".join(paginas) if paginas else None
     if not texto:
         return None
 
@@ -36,52 +281,130 @@ def extrair_dados_do_contrato_por_tipo(pdf_bytes: bytes, tipo_analise: str = 'pa
     if tipo_analise == 'sistema':
         return _extrair_com_regex(texto)
     else:
-        return _extrair_com_nlp(texto)
+        return _extrair_com_nlp(paginas)
+
+def extrair_dados_de_contratos_por_tipo(lista_pdf: List[Union[bytes, IO[bytes]]], tipo_analise: str = 'padrao') -> List[Optional[Dict[str, Any]]]:
+    """
+    Versão em lote de 'extrair_dados_do_contrato_por_tipo'. Os textos são
+    processados juntos pelo nlp.pipe, e o resultado mantém a ordem da
+    entrada (None para os PDFs dos quais não foi possível extrair texto).
+    """
+    documentos = [_extrair_texto_de_pdf(pdf, por_pagina=True) for pdf in lista_pdf]
+    textos = ["".join(paginas) if paginas else None for paginas in documentos]
+
+    if tipo_analise == 'sistema':
+        return [_extrair_com_regex(texto) if texto else None for texto in textos]
+
+    validos = [paginas for paginas, texto in zip(documentos, textos) if texto]
+    resultados = iter(_extrair_com_nlp_batch(validos) if validos else [])
+    return [next(resultados) if texto else None for texto in textos]
+
+def _extrair_texto_de_pdf(pdf: Union[bytes, IO[bytes]], por_pagina: bool = False) -> Optional[Union[str, List[str]]]:
+    if isinstance(pdf, (bytes, bytearray)):
+        return _extrair_texto_de_pdf_bytes(pdf, por_pagina)
+    return _extrair_texto_de_pdf_stream(pdf, por_pagina)
 
-def _extrair_texto_de_pdf_bytes(pdf_bytes: bytes) -> Optional[str]:
+def _extrair_texto_de_pdf_bytes(pdf_bytes: bytes, por_pagina: bool = False) -> Optional[Union[str, List[str]]]:
     try:
-        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-            return "".join(pagina.get_text("text") for pagina in doc)
+        return _extrair_texto_de_pdf_buffer(pdf_bytes, por_pagina)
     except Exception as e:
         print(f"[ERRO] Falha ao extrair texto do PDF a partir dos bytes: {e}")
         return None
 
+def _extrair_texto_de_pdf_stream(stream: IO[bytes], por_pagina: bool = False) -> Optional[Union[str, List[str]]]:
+    """
+    Extrai o texto direto do stream do upload, sem criar uma cópia do PDF em
+    'bytes'. O Werkzeug entrega o upload num SpooledTemporaryFile: enquanto ele
+    está em memória (até 500 KB), o BytesIO interno é lido pelo próprio buffer;
+    só quando já foi para o disco o arquivo é mapeado na memória com mmap. Chamar
+    fileno() num spooled ainda em memória forçaria a gravação em disco.
+    """
+    try:
+        # '_rolled' e '_file' são atributos internos do SpooledTemporaryFile; se não
+        # existirem, segue pelo caminho do fileno()/read() abaixo.
+        if isinstance(stream, tempfile.SpooledTemporaryFile) and not getattr(stream, "_rolled", True):
+            stream = getattr(stream, "_file", None) or stream
+        if isinstance(stream, io.BytesIO):
+            with stream.getbuffer() as buffer:
+                return _extrair_texto_de_pdf_buffer(buffer, por_pagina)
+        try:
+            descritor = stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return _extrair_texto_de_pdf_buffer(stream.read(), por_pagina)
+        with mmap.mmap(descritor, 0, access=mmap.ACCESS_READ) as mapa:
+            with memoryview(mapa) as buffer:
+                return _extrair_texto_de_pdf_buffer(buffer, por_pagina)
+    except Exception as e:
+        print(f"[ERRO] Falha ao extrair texto do PDF a partir do stream: {e}")
+        return None
+
+def _extrair_texto_de_pdf_buffer(buffer: Union[bytes, memoryview], por_pagina: bool = False) -> Union[str, List[str]]:
+    with fitz.open(stream=buffer, filetype="pdf") as doc:
+        paginas = [doc[i].get_text("text") for i in range(doc.page_count)]
+    return paginas if por_pagina else "".join(paginas)
+
+def _fatiar_secao(texto: str, inicio: re.Pattern, fim: re.Pattern) -> Optional[str]:
+    """
+    Retorna o trecho entre a primeira ocorrência de 'inicio' e a ocorrência
+    seguinte de 'fim'. As duas pontas são buscadas separadamente, em vez de uma
+    ponte '[\\s\\S]*?' que força o motor de regex a varrer o documento inteiro
+    a partir de cada início quando não há correspondência.
+    """
+    m_inicio = inicio.search(texto)
+    if not m_inicio:
+        return None
+    m_fim = fim.search(texto, m_inicio.end())
+    if not m_fim:
+        return None
+    return texto[m_inicio.end():m_fim.start()]
+
+# Valores padrão dos dados extraídos; cada extração parte de uma cópia e só
+# sobrescreve os campos encontrados.
+_DADOS_TEMPLATE_REGEX = {
+    "Contratante": {"Nome": "N/A", "CPF": "N/A", "Telefone": "N/A", "Email": "N/A", "RG": "N/A", "Endereco": "N/A"},
+    "Data_do_Evento": "N/A", "Local_do_Evento": "N/A", "produtosContratadosJson": "[]",
+    "Data_de_Pagamento": "N/A", "Valor_Total_do_Pedido": "N/A", "FormaDePagamento": "N/A",
+    "Responsavel": "N/A", "Como nos conheceu": "N/A"
+}
+_DADOS_TEMPLATE_NLP = {
+    "Contratante": {"Nome": "Não encontrado", "CPF": "N/A", "Telefone": "N/A", "Email": "N/A"},
+    "Data_do_Evento": "Não encontrado", "Local_do_Evento": "Não encontrado", "produtosContratadosJson": '[]',
+    "Data_de_Pagamento": "Verificar no Doc.", "Valor_Total_do_Pedido": "Não encontrado", "FormaDePagamento": "Verificar no Doc."
+}
+
+def _novos_dados(template: Dict[str, Any]) -> Dict[str, Any]:
+    # Todos os valores são strings (imutáveis), então basta copiar o dicionário
+    # e o "Contratante" aninhado; um copy.deepcopy seria custo à toa.
+    return {**template, "Contratante": dict(template["Contratante"])}
+
 def _extrair_com_regex(texto: str) -> Dict[str, Any]:
-    flags = re.DOTALL | re.IGNORECASE
-    dados = {
-        "Contratante": {"Nome": "N/A", "CPF": "N/A", "Telefone": "N/A", "Email": "N/A", "RG": "N/A", "Endereco": "N/A"},
-        "Data_do_Evento": "N/A", "Local_do_Evento": "N/A", "produtosContratadosJson": "[]",
-        "Data_de_Pagamento": "N/A", "Valor_Total_do_Pedido": "N/A", "FormaDePagamento": "N/A",
-        "Responsavel": "N/A", "Como nos conheceu": "N/A"
-    }
-
-    bloco_contratante = re.search(r"CONTRATANTE:\s*Sr\(a\)([\s\S]*?)CONTRATADO:", texto, flags)
-    if bloco_contratante:
-        texto_contratante = bloco_contratante.group(1)
-        dados["Contratante"]["Nome"] = (m.group(1).strip() if (m := re.search(r"^\s*(.*?),\s*brasileiro", texto_contratante, flags)) else "N/A")
-        dados["Contratante"]["RG"] = (m.group(1).strip() if (m := re.search(r"RG:\s*([\d.\s-]+?)\s*e", texto_contratante, flags)) else "N/A")
-        dados["Contratante"]["CPF"] = (m.group(1).strip() if (m := re.search(r"CPF:\s*([\d.\s-]+?),", texto_contratante, flags)) else "N/A")
-        dados["Contratante"]["Endereco"] = (m.group(1).strip() if (m := re.search(r"domiciliado\(a\) na\s*(.*?)\s*-\s*Tel\.", texto_contratante, flags)) else "N/A")
-        dados["Contratante"]["Telefone"] = (m.group(1).strip() if (m := re.search(r"Tel\.\s*([\d\(\)\s-]+?)\.", texto_contratante, flags)) else "N/A")
-        dados["Contratante"]["Email"] = (m.group(1).strip() if (m := re.search(r"E-\s*mail:\s*([\w.%+-]+@[\w.-]+\.[a-zA-Z]{2,})", texto_contratante, flags)) else "N/A")
-
-    bloco_produtos = re.search(r'CLÁUSULA 1 - PRODUTOS CONTRATADOS([\s\S]*?)TOTAL:\s*R\$', texto, flags)
-    if bloco_produtos:
-        texto_produtos = bloco_produtos.group(1)
-        itens = re.findall(r'(\d+)\s+(.*?)\s+R\$\s*([\d.,]+)\s+R\$\s*([\d.,]+)', texto_produtos)
-        produtos_lista = []
-        for item in itens:
-            produtos_lista.append({
-                'Quantidade': item[0].strip(),
-                'Produto': item[1].strip(),
-                'Valor Unitário': item[2].strip(),
-                'Valor Total Item': item[3].strip()
-            })
+    dados = _novos_dados(_DADOS_TEMPLATE_REGEX)
+
+    texto_contratante = _fatiar_secao(texto, _RE_INICIO_CONTRATANTE, _RE_FIM_CONTRATANTE)
+    if texto_contratante:
+        if (m := _RE_NOME.search(texto_contratante)): dados["Contratante"]["Nome"] = m.group(1).strip()
+        if (m := _RE_RG.search(texto_contratante)): dados["Contratante"]["RG"] = m.group(1).strip()
+        if (m := _RE_CPF.search(texto_contratante)): dados["Contratante"]["CPF"] = m.group(1).strip()
+        if (m := _RE_ENDERECO.search(texto_contratante)): dados["Contratante"]["Endereco"] = m.group(1).strip()
+        if (m := _RE_TELEFONE.search(texto_contratante)): dados["Contratante"]["Telefone"] = m.group(1).strip()
+        if (m := _RE_EMAIL.search(texto_contratante)): dados["Contratante"]["Email"] = m.group(1).strip()
+
+    texto_produtos = _fatiar_secao(texto, _RE_INICIO_PRODUTOS, _RE_FIM_PRODUTOS)
+    if texto_produtos:
+        # Uma única passada com finditer, montando os itens direto dos grupos.
+        # O "R$" fica fora dos grupos na própria regex e os grupos numéricos não
+        # capturam espaços, então só o nome do produto precisa de strip().
+        produtos_lista = [{
+            'Quantidade': m[1],
+            'Produto': m[2].strip(),
+            'Valor Unitário': m[3],
+            'Valor Total Item': m[4]
+        } for m in _RE_ITENS.finditer(texto_produtos)]
         if produtos_lista:
             dados["produtosContratadosJson"] = json.dumps(produtos_lista, ensure_ascii=False)
             
-    dados["Valor_Total_do_Pedido"] = (m.group(1).strip() if (m := re.search(r"TOTAL:\s*(R\$\s*[\d.,]+)", texto, flags)) else "N/A")
-    
+    if (m := _RE_VALOR_TOTAL.search(texto)): dados["Valor_Total_do_Pedido"] = m.group(1).strip()
+
     # ========================== INÍCIO DA MUDANÇA DOCUMENTADA ==========================
     #
     # PROBLEMA: Uma nova quebra de linha foi encontrada, desta vez entre as palavras
@@ -93,131 +416,211 @@ def _extrair_com_regex(texto: str) -> Dict[str, Any]:
     # CÓDIGO ANTIGO: r"foram pagos no\s+dia\s+([\d/]+)..."
     # CÓDIGO NOVO: r"foram\s+pagos\s+no\s+dia\s+([\d/]+)..."
     #
-    bloco_pagamento = re.search(r"foram\s+pagos\s+no\s+dia\s+([\d/]+)\s+(.*?)\.", texto, flags)
+    bloco_pagamento = _RE_PAGAMENTO.search(texto)
     if bloco_pagamento:
         dados["Data_de_Pagamento"] = bloco_pagamento.group(1).strip()
         dados["FormaDePagamento"] = bloco_pagamento.group(2).strip()
     # =========================== FIM DA MUDANÇA DOCUMENTADA ============================
-    
-    bloco_evento = re.search(r"O evento acontecerá no dia:\s*([\d/]+)\s*-\s*Local do evento:\s*(.*?)\n", texto, flags)
-    if bloco_evento:
-        dados["Data_do_Evento"] = bloco_evento.group(1).strip()
-        dados["Local_do_Evento"] = bloco_evento.group(2).strip()
 
-    dados["Como nos conheceu"] = (m.group(1).strip() if (m := re.search(r"Como nos conheceu:\s*(.*?)\n", texto, flags)) else "N/A")
-    dados["Responsavel"] = (m.group(1).strip() if (m := re.search(r"RESPONSÁVEL PELO CONTRATO:\s*(.*?)\s*\n", texto, flags)) else "N/A")
+    if (m := _RE_RESPONSAVEL.search(texto)): dados["Responsavel"] = m.group(1).strip()
+
+    # Como no 're.search' de cada campo, vale sempre a primeira ocorrência.
+    encontrados = set()
+    for m in _RE_CAMPOS.finditer(texto):
+        campo = m.lastgroup
+        if campo in encontrados:
+            continue
+        encontrados.add(campo)
+
+        if campo == "evento":
+            dados["Data_do_Evento"] = m.group("data_evt").strip()
+            dados["Local_do_Evento"] = m.group("local_evt").strip()
+        elif campo == "como_conheceu":
+            dados["Como nos conheceu"] = m.group("origem").strip()
     return dados
 
-def _extrair_com_nlp(texto: str) -> Dict[str, Any]:
+def _extrair_com_nlp(paginas: List[str]) -> Dict[str, Any]:
+    return _extrair_com_nlp_batch([paginas])[0]
+
+def _extrair_com_nlp_batch(documentos: List[List[str]]) -> List[Dict[str, Any]]:
+    """
+    Recebe cada contrato como lista de páginas. O NER roda página a página (as
+    mesmas páginas de todos os contratos pendentes vão juntas no nlp.pipe) e
+    para assim que o contrato já tem uma pessoa (PER) e um local (LOC), o que
+    quase sempre acontece na primeira página; as cláusulas fixas das páginas
+    seguintes só passam pelo tokenizador, suficiente para o Matcher.
+    """
+    nlp = _get_nlp()
     if not nlp: raise Exception("Modelo de linguagem spaCy não foi carregado.")
-    doc = nlp(texto)
-    dados = {"Contratante": { "Nome": "Não encontrado", "CPF": "N/A", "Telefone": "N/A", "Email": "N/A" }, "Data_do_Evento": "Não encontrado", "Local_do_Evento": "Não encontrado", "produtosContratadosJson": '[]', "Data_de_Pagamento": "Verificar no Doc.", "Valor_Total_do_Pedido": "Não encontrado", "FormaDePagamento": "Verificar no Doc."}
+    from spacy.tokens import Doc
+    docs_por_contrato = [[] for _ in documentos]
+    pendentes = list(range(len(documentos)))
+    pagina = 0
+    while pendentes:
+        alvo = [i for i in pendentes if pagina < len(documentos[i])]
+        textos = [documentos[i][pagina] for i in alvo]
+        for i, doc in zip(alvo, nlp.pipe(textos, batch_size=_SPACY_BATCH_SIZE)):
+            docs_por_contrato[i].append(doc)
+        pendentes = [i for i in alvo if not _tem_pessoa_e_local(docs_por_contrato[i])]
+        pagina += 1
+
+    resultados = []
+    for paginas, docs in zip(documentos, docs_por_contrato):
+        docs.extend(nlp.make_doc(texto) for texto in paginas[len(docs):])
+        resultados.append(_montar_dados_nlp(Doc.from_docs(docs)))
+    return resultados
+
+def _tem_pessoa_e_local(docs) -> bool:
+    rotulos = {ent.label_ for doc in docs for ent in doc.ents}
+    return "PER" in rotulos and "LOC" in rotulos
+
+def _montar_dados_nlp(doc) -> Dict[str, Any]:
+    dados = _novos_dados(_DADOS_TEMPLATE_NLP)
     pessoas = [ent.text for ent in doc.ents if ent.label_ == "PER"]
     locais = [ent.text for ent in doc.ents if ent.label_ == "LOC"]
     if pessoas: dados["Contratante"]["Nome"] = pessoas[0]
     if locais: dados["Local_do_Evento"] = locais[0]
-    dados["Contratante"]["CPF"] = (m.group(1) if (m := re.search(r"(\d{3}\.\d{3}\.\d{3}-\d{2})", texto)) else "N/A")
-    dados["Contratante"]["Telefone"] = (m.group(1) if (m := re.search(r"(\(?\d{2}\)?\s*\d{4,5}-?\d{4})", texto)) else "N/A")
-    dados["Contratante"]["Email"] = (m.group(1) if (m := re.search(r"([\w.\-]+@[\w.\-]+)", texto)) else "N/A")
-    dados["Valor_Total_do_Pedido"] = (m.group(1) if (m := re.search(r"(?:valor\s*total|preço\s*final)[\s\S]*?(R\$\s*[\d.,]+)", texto, re.IGNORECASE)) else "Não encontrado")
-    dados["Data_do_Evento"] = (m.group(1) if (m := re.search(r"data\s*do\s*evento[:\s]*(\d{2}/\d{2}/\d{4})", texto, re.IGNORECASE)) else "Não encontrado")
+
+    # Como no re.search, vale a primeira ocorrência de cada padrão no documento.
+    encontrados = {}
+    for match_id, inicio, fim in sorted(_matcher(doc), key=lambda m: m[1]):
+        rotulo = nlp.vocab.strings[match_id]
+        if rotulo == "VALOR_TOTAL" and fim - inicio > _VALOR_TOTAL_JANELA + 4:
+            continue
+        encontrados.setdefault(rotulo, (inicio, fim))
+    valores = {}
+    for rotulo, (inicio, fim) in encontrados.items():
+        if rotulo == "VALOR_TOTAL": inicio = fim - 2
+        elif rotulo == "DATA_EVENTO": inicio = fim - 1
+        valores[rotulo] = doc[inicio:fim].text
+
+    faltando = [rotulo for rotulo in _RE_NLP_RESERVA if rotulo not in valores]
+    if faltando:
+        texto = doc.text
+        for rotulo in faltando:
+            if (m := _RE_NLP_RESERVA[rotulo].search(texto)): valores[rotulo] = m.group(1)
+
+    if "CPF" in valores: dados["Contratante"]["CPF"] = valores["CPF"]
+    if "TELEFONE" in valores: dados["Contratante"]["Telefone"] = valores["TELEFONE"]
+    if "EMAIL" in valores: dados["Contratante"]["Email"] = valores["EMAIL"]
+    if "VALOR_TOTAL" in valores: dados["Valor_Total_do_Pedido"] = valores["VALOR_TOTAL"]
+    if "DATA_EVENTO" in valores: dados["Data_do_Evento"] = valores["DATA_EVENTO"]
     return dados
 
-# O restante do arquivo (geração de DOCX, PDF, etc.) permanece inalterado.
-def gerar_contrato_docx(dados: Dict[str, Any]) -> Optional[BytesIO]:
+# Template HTML do contrato em PDF compilado uma única vez. Sem o loader do Flask
+# (e sem auto_reload) não há checagem de mtime a cada render, e a função passa a
+# funcionar fora do contexto da aplicação (ex: em um worker de fila).
+_JINJA_ENV = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+_CONTRATO_HTML_TPL = _JINJA_ENV.get_template('contrato_template.html')
+
+# Folha de estilo e configuração de fontes do contrato em PDF, preparadas uma
+# única vez por processo e reaproveitadas em todas as chamadas ao WeasyPrint.
+_FONT_CFG = FontConfiguration()
+_CONTRATO_CSS = [CSS(filename=os.path.join(os.path.dirname(__file__), 'static', 'css', 'contrato.css'), font_config=_FONT_CFG)]
+
+# Modelo do contrato em DOCX: as cláusulas fixas já estão prontas no arquivo e
+# apenas os campos dinâmicos são preenchidos a cada contrato gerado.
+_CONTRATO_DOCX_PATH = os.path.join(os.path.dirname(__file__), 'templates', 'contrato_base.docx')
+with open(_CONTRATO_DOCX_PATH, 'rb') as _f:
+    _CONTRATO_DOCX_BYTES = _f.read()
+
+def gerar_contrato_docx(dados: Dict[str, Any], sink: IO[bytes]) -> bool:
+    """Gera o contrato em DOCX escrevendo direto em 'sink'. Retorna False em caso de erro."""
     try:
-        document = Document()
-        document.add_heading('Divinos Doces Finos', 0)
-        document.add_paragraph('CONTRATO', style='Normal')
-        document.add_paragraph()
+        # Cada render precisa de um DocxTemplate novo (o docxtpl altera o documento
+        # ao renderizar), mas o arquivo em si é lido do disco uma única vez.
+        template = DocxTemplate(BytesIO(_CONTRATO_DOCX_BYTES))
         contratante = dados.get('Contratante', {})
-        contratante_texto = document.add_paragraph()
-        contratante_texto.add_run('CONTRATANTE: ').bold = True
-        contratante_texto.add_run(f"Sr(a) {contratante.get('Nome', 'N/A')}, brasileiro(a), portador(a) da cédula de RG: {contratante.get('RG', 'N/A')} e CPF: {contratante.get('CPF', 'N/A')}, residente e domiciliado(a) na {contratante.get('Endereco', 'N/A')} - Tel. {contratante.get('Telefone', 'N/A')}.")
-        contratado_texto = document.add_paragraph()
-        contratado_texto.add_run('CONTRATADO: ').bold = True
-        contratado_texto.add_run(f"Divinos Doces Finos, inscrito sob o CNPJ: 18.826.801/0001-76, com sede na Rua Curupacê, 392 Mooca, São Paulo SP representado pela sócia proprietária Damaris Talita Macedo, portador do RG: 30.315.655-7.")
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 1 - PRODUTOS CONTRATADOS', level=1)
-        produtos = dados.get('Produtos Contratados', [])
-        if produtos:
-            tabela = document.add_table(rows=1, cols=4)
-            tabela.style = 'Table Grid'
-            hdr_cells = tabela.rows[0].cells
-            hdr_cells[0].text, hdr_cells[1].text, hdr_cells[2].text, hdr_cells[3].text = 'Quantidade', 'Produto', 'Valor Unitário', 'Valor Total'
-            for item in produtos:
-                row_cells = tabela.add_row().cells
-                row_cells[0].text, row_cells[1].text, row_cells[2].text, row_cells[3].text = str(item.get('Quantidade', '')), str(item.get('Produto', '')), str(item.get('Valor Unitário', '')), str(item.get('Valor Total Item', ''))
-            document.add_paragraph(f"TOTAL: R$ {dados.get('Valor Total do Pedido', 'N/A')}")
-        else:
-            document.add_paragraph("Nenhum produto adicionado.")
-        document.add_heading('CLÁUSULA 2 - VALOR E FORMA DE PAGAMENTO', level=1)
-        document.add_paragraph(f"O valor total de R$ {dados.get('Valor Total do Pedido', 'N/A')} referente aos produtos acima citados, foram pagos no dia {dados.get('Data de Pagamento', 'N/A')} {dados.get('Forma de Pagamento', 'N/A')}.")
-        document.add_heading('CLÁUSULA 3 - EMBALAGEM DOS DOCES - FORMINHAS', level=1)
-        document.add_paragraph('Os doces finos são entregues em forminhas no formato caixeta, na cor branca, todos decorados e prontos para o consumo. Os brigadeiros serão entregues em forminhas na cor branca nº 5.')
-        document.add_paragraph('Caso o CONTRATANTE opte por embalagens decorativas, o mesmo deverá enviar ao CONTRATADO com no máximo 15 dias de antecedência ao evento, que entregará os doces finos dentro das embalagens decoradas, prontos para o consumo. Após esse prazo não recebemos.')
-        document.add_paragraph('Por haver um manejo especial nas forminhas no modelo de flor e um custo maior de compra de caixas para armazenamento dos doces, é cobrado uma taxa adicional de R$0,10 por unidade, como consta abaixo:')
-        document.add_paragraph('ATÉ 100 DOCES + R$10,00 / ATÉ 200 DOCES + R$20,00 ATÉ 300 DOCES + R$30,00 / ATÉ 400 DOCES + R$40,00 ACIMA DE 500 DOCES + R$50,00 e assim sucessivamente')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 4 - EMBALAGENS DOS BEM-CASADOS', level=1)
-        document.add_paragraph('Os bem-casados são entregues em papel crepom crepe plus, com celofane e fita de cetim de 7mm, nas cores enviadas na tabela completa. Os papéis perolados da linha especial serão cobrados R$ 0,40 a mais por unidade e os papéis dourado, prata, tiffany e marsala serão cobrados R$ 0,20 a mais por unidade, por se tratar de um papel especial e com maior custo. Tudo está discriminado na tabela de cores.')
-        document.add_paragraph('Caso o CONTRATANTE opte por incluir, medalhinhas, tercinhos, renda, juta, tag ou outro item decorativo, deverá consultar antecipadamente a disponibilidade e todos os itens são colados com cola quente. A entrega dos itens deverá ocorrer com no máximo 15 dias antes do evento. Após esse prazo não recebemos. Por haver um manejo especial dos itens, será cobrado uma taxa adicional de R$0,10, como consta abaixo: ATÉ 100 BEM-CASADOS + R$10,00 / ATÉ 200 BEM-CASADOS + R$20,00 ATÉ 300 BEM-CASADOS + R$30,00 / ATÉ 400 BEM-CASADOS + R$40,00 ACIMA DE 500 BEM-CASADOS + R$50,00 e assim sucessivamente')
-        document.add_paragraph('Caso opte pela aplicação de dois ou mais itens, será cobrado o valor de cada item.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 5 - ALTERAÇÕES', level=1)
-        document.add_paragraph('Não recebemos forminhas, modificações, alterações em contrato em hipótese alguma na semana do evento.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 6 - ADIÇÃO DE NOVOS ITENS', level=1)
-        document.add_paragraph('Caso haja a necessidade do CONTRATANTE adicionar novos itens ao pedido fechado, o valor dos produtos será de acordo com o valor vigente no momento da adição, mesmo que o contrato tenha sido fechado com valores promocionais.')
-        document.add_paragraph('A adição de produtos ocorre de acordo com a disponibilidade de agenda. Não havendo disponibilidade para novos produtos ou pedidos, não será possível a complementação.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 7 - RETIRada OU SERVIÇO DE ENTREGA', level=1)
-        document.add_paragraph(f"A entrega ou retirada dos itens acima, deverá ser definida pela CONTRATANTE até 15 dias antes do evento. Em caso de entrega será cobrada taxa de deslocamento de R$ 6,00 por km ou a taxa mínima de R$50,00 (sujeito a disponibilidade na data e horário desejados). Não fazemos entregas aos domingos e feriados. A retirada dos produtos ocorre de segunda-feira à sábado, das 9h às 16h30, mediante agendamento com o setor responsável, não havendo expediente aos domingos e feriados.")
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 8 - ARMAZENAMENTO', level=1)
-        document.add_paragraph('Todos os doces e/ou bem-casados deverão, obrigatoriamente, ser armazenados em geladeira até o momento da montagem da mesa para o evento. Validade 3 a 5 dias em geladeira.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 9 - LOCAÇÃO (SE HOUVER)', level=1)
-        document.add_paragraph('Caso haja locação de bolo cenográfico, o CONTRATANTE deverá deixar uma caução no valor de R$300,00 ou o valor em dinheiro, como forma de garantia. O bolo cenográfico sendo locado e deverá retornar nas mesmas condições, em até 4 dias após a data da retirada. Na devolução do bolo cenográfico, será devolvido o valor total. Em caso de avarias será cobrado R$ 100,00 por andar (dependendo do modelo) para refazer cada andar danificado. O CONTRATANTE deverá tomar todos os cuidados necessários como: não expor ao calor excessivo, água ou qualquer outro líquido, não deverá apertar, amassar, não deixar convidados colocarem as mãos e deverá ser transportado com cuidado, pegando somente pela base de madeira.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 10 - REMARCAÇÃO', level=1)
-        document.add_paragraph('Em caso de REMARCAÇÃO de data do evento superior a 6 meses, será cobrado um reequilíbrio econômico e financeiro de 10% sobre o valor do contrato, a cada 6 meses de diferença da data marcada inicialmente.')
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 11 - DATA E LOCAL DO EVENTO', level=1)
-        document.add_paragraph(f"O evento acontecerá no dia: {dados.get('Data do Evento', 'N/A')} - Local do evento: {dados.get('Local do Evento', 'N/A')}")
-        document.add_paragraph(f"Como nos conheceu: {dados.get('Como nos conheceu', 'N/A')}")
-        document.add_paragraph()
-        document.add_heading('CLÁUSULA 12 - CANCELAMENTO', level=1)
-        document.add_paragraph('A CONTRATANTE pagará multa de 30% do valor do contrato em caso de cancelamento. O CONTRATADO pagará multa de 100% do valor do contrato em caso de cancelamento.')
-        document.add_paragraph()
-        document.add_paragraph(f"RESPONSÁVEL PELO CONTRATO: {dados.get('Responsavel', 'N/A')}")
-        document.add_paragraph(f"São Paulo, {dados.get('Data de Pagamento', 'N/A')}")
-        document.add_paragraph()
-        document.add_paragraph('CONTRATANTE', style='Normal').bold = True
-        document.add_paragraph('______________________________', style='Normal')
-        document.add_paragraph('CONTRATADO', style='Normal').bold = True
-        document.add_paragraph('______________________________', style='Normal')
-        
-        doc_stream = BytesIO()
-        document.save(doc_stream)
-        doc_stream.seek(0)
-        return doc_stream
+        produtos = [{
+            'Quantidade': str(item.get('Quantidade', '')),
+            'Produto': str(item.get('Produto', '')),
+            'ValorUnitario': str(item.get('Valor Unitário', '')),
+            'ValorTotalItem': str(item.get('Valor Total Item', '')),
+        } for item in dados.get('Produtos Contratados', [])]
+        contexto = {
+            'contratante': {campo: contratante.get(campo, 'N/A') for campo in ('Nome', 'RG', 'CPF', 'Endereco', 'Telefone')},
+            'produtos': produtos,
+            'valor_total': dados.get('Valor Total do Pedido', 'N/A'),
+            'data_pagamento': dados.get('Data de Pagamento', 'N/A'),
+            'forma_pagamento': dados.get('Forma de Pagamento', 'N/A'),
+            'data_evento': dados.get('Data do Evento', 'N/A'),
+            'local_evento': dados.get('Local do Evento', 'N/A'),
+            'como_conheceu': dados.get('Como nos conheceu', 'N/A'),
+            'responsavel': dados.get('Responsavel', 'N/A'),
+        }
+        template.render(contexto, autoescape=True)
+        template.save(sink)
+        return True
     except Exception as e:
         print(f"[ERRO] Falha ao gerar contrato DOCX: {e}")
-        return None
+        return False
 
-def gerar_contrato_pdf_direto(dados: Dict[str, Any]) -> Optional[BytesIO]:
+def gerar_contrato_pdf_direto(dados: Dict[str, Any], sink: IO[bytes]) -> bool:
+    """Gera o contrato em PDF escrevendo direto em 'sink'. Retorna False em caso de erro."""
     try:
-        html_string = render_template("contrato_template.html", dados=dados)
-        pdf_bytes = HTML(string=html_string).write_pdf()
-        pdf_stream = BytesIO(pdf_bytes)
-        pdf_stream.seek(0)
-        return pdf_stream
+        html_string = _CONTRATO_HTML_TPL.render(dados=dados)
+        HTML(string=html_string).write_pdf(target=sink, stylesheets=_CONTRATO_CSS, font_config=_FONT_CFG)
+        return True
     except Exception as e:
         print(f"[ERRO] Falha ao gerar contrato PDF com WeasyPrint: {e}")
-        return None
+        return False
+
+_CABECALHO_PRODUTOS = ('Quantidade', 'Produto', 'Valor Unitário', 'Valor Total')
+_CHAVES_PRODUTOS = ('Quantidade', 'Produto', 'Valor Unitário', 'Valor Total Item')
+
 
-def gerar_relatorio_entrega(dados: Dict[str, Any]) -> Optional[BytesIO]:
+def _tabela_produtos_xml(document, produtos: List[Dict[str, Any]]):
+    """
+    Monta o <w:tbl> completo da tabela de produtos (estilo 'Table Grid', cabeçalho + uma
+    linha por item) de uma só vez, sem passar por add_row()/cell.text para cada célula.
+    """
+    secao = document.sections[-1]
+    largura_coluna = str(Emu((secao.page_width - secao.left_margin - secao.right_margin) // len(_CABECALHO_PRODUTOS)).twips)
+
+    tbl = OxmlElement('w:tbl')
+    tbl_pr = SubElement(tbl, qn('w:tblPr'))
+    SubElement(tbl_pr, qn('w:tblStyle'), {qn('w:val'): document.styles['Table Grid'].style_id})
+    SubElement(tbl_pr, qn('w:tblW'), {qn('w:type'): 'auto', qn('w:w'): '0'})
+    SubElement(tbl_pr, qn('w:tblLook'), {
+        qn('w:firstColumn'): '1', qn('w:firstRow'): '1', qn('w:lastColumn'): '0',
+        qn('w:lastRow'): '0', qn('w:noHBand'): '0', qn('w:noVBand'): '1', qn('w:val'): '04A0',
+    })
+    tbl_grid = SubElement(tbl, qn('w:tblGrid'))
+    for _ in _CABECALHO_PRODUTOS:
+        SubElement(tbl_grid, qn('w:gridCol'), {qn('w:w'): largura_coluna})
+
+    linhas = [_CABECALHO_PRODUTOS]
+    linhas.extend([str(item.get(chave, '')) for chave in _CHAVES_PRODUTOS] for item in produtos)
+    for linha in linhas:
+        tr = SubElement(tbl, qn('w:tr'))
+        for texto in linha:
+            tc = SubElement(tr, qn('w:tc'))
+            tc_pr = SubElement(tc, qn('w:tcPr'))
+            SubElement(tc_pr, qn('w:tcW'), {qn('w:type'): 'dxa', qn('w:w'): largura_coluna})
+            run = SubElement(SubElement(tc, qn('w:p')), qn('w:r'))
+            if texto:
+                t = SubElement(run, qn('w:t'))
+                t.text = texto
+                if texto != texto.strip():
+                    t.set(qn('xml:space'), 'preserve')
+    return tbl
+
+
+def _inserir_no_corpo(document, elemento) -> None:
+    """Insere 'elemento' no fim do corpo do documento, antes do <w:sectPr> final."""
+    corpo = document.element.body
+    if corpo.sectPr is not None:
+        corpo.sectPr.addprevious(elemento)
+    else:
+        corpo.append(elemento)
+
+
+def gerar_relatorio_entrega(dados: Dict[str, Any], sink: IO[bytes]) -> bool:
+    """Gera o relatório de entrega em DOCX escrevendo direto em 'sink'. Retorna False em caso de erro."""
     try:
         document = Document()
         document.add_heading('RELATÓRIO DE ENTREGA', 0)
@@ -231,13 +634,7 @@ def gerar_relatorio_entrega(dados: Dict[str, Any]) -> Optional[BytesIO]:
         document.add_paragraph("\nProdutos Contratados:")
         produtos = dados.get('Produtos Contratados', [])
         if produtos:
-            tabela = document.add_table(rows=1, cols=4)
-            tabela.style = 'Table Grid'
-            hdr_cells = tabela.rows[0].cells
-            hdr_cells[0].text, hdr_cells[1].text, hdr_cells[2].text, hdr_cells[3].text = 'Quantidade', 'Produto', 'Valor Unitário', 'Valor Total'
-            for item in produtos:
-                row_cells = tabela.add_row().cells
-                row_cells[0].text, row_cells[1].text, row_cells[2].text, row_cells[3].text = str(item.get('Quantidade', '')), str(item.get('Produto', '')), str(item.get('Valor Unitário', '')), str(item.get('Valor Total Item', ''))
+            _inserir_no_corpo(document, _tabela_produtos_xml(document, produtos))
         else:
             document.add_paragraph("Nenhum produto encontrado.")
         document.add_paragraph(f"\nValor Total do Pedido: R$ {dados.get('Valor Total do Pedido', 'Não encontrado')}")
@@ -245,33 +642,30 @@ def gerar_relatorio_entrega(dados: Dict[str, Any]) -> Optional[BytesIO]:
         document.add_paragraph("______________________________\nResponsável pela Entrega")
         document.add_paragraph("\n\n")
         document.add_paragraph("______________________________\nResponsável pela Retirada")
-        doc_stream = BytesIO()
-        document.save(doc_stream)
-        doc_stream.seek(0)
-        return doc_stream
+        document.save(sink)
+        return True
     except Exception as e:
         print(f"[ERRO] Falha ao salvar relatório de entrega: {e}")
-        return None
+        return False
 
-def exportar_para_excel(dados: Dict[str, Any]) -> Optional[BytesIO]:
+def exportar_para_excel(dados: Dict[str, Any], sink: IO[bytes]) -> bool:
+    """Exporta os dados extraídos para XLSX escrevendo direto em 'sink'. Retorna False em caso de erro."""
     try:
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Dados do Contrato"
-        sheet['A1'] = "Campo"
-        sheet['B1'] = "Informação Extraída"
-        linha_atual = 2
+        # constant_memory: cada linha é gravada assim que a próxima começa, sem
+        # manter a planilha inteira em memória (as linhas devem sair em ordem).
+        workbook = xlsxwriter.Workbook(sink, {'constant_memory': True})
+        sheet = workbook.add_worksheet("Dados do Contrato")
+        sheet.write_row(0, 0, ["Campo", "Informação Extraída"])
+        linha_atual = 1
         for chave, valor in dados.items():
             if chave == 'Produtos Contratados':
                 continue
             if isinstance(valor, dict):
                 for sub_chave, sub_valor in valor.items():
-                    sheet[f'A{linha_atual}'] = f"{chave} - {sub_chave}"
-                    sheet[f'B{linha_atual}'] = sub_valor
+                    sheet.write_row(linha_atual, 0, [f"{chave} - {sub_chave}", sub_valor])
                     linha_atual += 1
             else:
-                sheet[f'A{linha_atual}'] = chave
-                sheet[f'B{linha_atual}'] = valor
+                sheet.write_row(linha_atual, 0, [chave, valor])
                 linha_atual += 1
         linha_atual += 2
         produtos_contratados_str = dados.get('produtosContratadosJson')
@@ -279,17 +673,13 @@ def exportar_para_excel(dados: Dict[str, Any]) -> Optional[BytesIO]:
             produtos_contratados = json.loads(produtos_contratados_str)
             if produtos_contratados and isinstance(produtos_contratados, list) and len(produtos_contratados) > 0:
                 headers_produtos = list(produtos_contratados[0].keys())
-                for col_idx, header in enumerate(headers_produtos, 1):
-                    sheet.cell(row=linha_atual, column=col_idx, value=header)
+                sheet.write_row(linha_atual, 0, headers_produtos)
                 linha_atual += 1
                 for produto in produtos_contratados:
-                    for col_idx, header in enumerate(headers_produtos, 1):
-                        sheet.cell(row=linha_atual, column=col_idx, value=produto.get(header, 'N/A'))
+                    sheet.write_row(linha_atual, 0, [produto.get(header, 'N/A') for header in headers_produtos])
                     linha_atual += 1
-        excel_stream = BytesIO()
-        workbook.save(excel_stream)
-        excel_stream.seek(0)
-        return excel_stream
+        workbook.close()
+        return True
     except Exception as e:
         print(f"\n[ERRO] Não foi possível salvar a planilha: {e}")
-        return None
\ No newline at end of file
+        return False
\ No newline at end of file
@@ -1,8 +1,11 @@
 # Arquivo: app/contratos/routes.py (VERSÃO FINAL, 100% COMPLETA E MESCLADA)
 
+import os
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app, after_this_request
 from app import db
 from app.models import Pedido
 
@@ -15,12 +18,19 @@ from typing import Dict, Any
 # Os nomes são claros e refletem suas funções específicas.
 from app.Extractor import (
     extrair_dados_do_contrato_por_tipo,
+    extrair_dados_de_contratos_por_tipo,
+    cache_extracao,
     gerar_contrato_docx,
     gerar_contrato_pdf_direto
 )
 
 contratos_bp = Blueprint('contratos', __name__, url_prefix='/api/contracts')
 
+# Pool compartilhado para a extração (PyMuPDF + spaCy). O PyMuPDF libera o GIL
+# durante a leitura do PDF, então uploads simultâneos se sobrepõem em vez de
+# ficarem presos cada um ao seu worker do Flask.
+_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
 # ==============================================================================
 # ROTA DE UPLOAD E ANÁLISE (ATUALIZADA)
 # ==============================================================================
@@ -47,16 +57,32 @@ def upload_contract():
     tipo_analise = request.form.get('tipo_analise', 'padrao')
 
     try:
-        # OTIMIZAÇÃO: Lê o arquivo em memória (file.read()) em vez de salvá-lo no disco.
-        # É mais rápido e não deixa lixo no servidor.
-        pdf_bytes = file.read()
+        # OTIMIZAÇÃO: O PDF é lido direto do stream do upload (file.stream), sem
+        # file.read(), evitando manter uma segunda cópia do arquivo em memória.
+        pdf_stream = file.stream
+
+        # CACHE: o mesmo PDF reenviado (fluxo de "revisar e reenviar") não é
+        # processado de novo; a chave é o SHA-256 do conteúdo + o tipo de análise.
+        # Qualquer valor diferente de 'sistema' roda o mesmo NLP, então todos
+        # dividem a mesma entrada (e o cliente não cria entradas novas à vontade).
+        tipo_cache = 'sistema' if tipo_analise == 'sistema' else 'padrao'
+        chave_cache = (cache_extracao.calcular_digest(pdf_stream), tipo_cache)
+        dados_em_cache = cache_extracao.get(chave_cache)
+        if dados_em_cache:
+            return jsonify({
+                'message': 'Dados extraídos com sucesso! Revise para salvar.',
+                'extractedData': dados_em_cache,
+            }), 200
 
         # CHAMA NOSSA FUNÇÃO INTELIGENTE: Ela escolhe o método de extração correto (Regex ou IA).
-        dados_extraidos = extrair_dados_do_contrato_por_tipo(pdf_bytes, tipo_analise)
+        future = _EXECUTOR.submit(extrair_dados_do_contrato_por_tipo, pdf_stream, tipo_analise)
+        dados_extraidos = future.result()
 
         if not dados_extraidos:
             return jsonify({'message': 'Não foi possível extrair dados do contrato.'}), 500
 
+        cache_extracao.set(chave_cache, dados_extraidos)
+
         # Retorna os dados para o frontend para o usuário revisar.
         # A estrutura deste JSON corresponde ao que o JavaScript espera.
         return jsonify({
@@ -68,6 +94,45 @@ def upload_contract():
         print(f"[ERRO] Falha na rota /upload: {e}")
         return jsonify({'message': f'Erro ao processar o contrato: {str(e)}'}), 500
 
+# ==============================================================================
+# ROTA DE UPLOAD E ANÁLISE EM LOTE
+# ==============================================================================
+@contratos_bp.route('/upload-batch', methods=['POST'])
+def upload_contracts_batch():
+    """
+    Recebe vários PDFs de uma vez (campo 'files') e extrai os dados de todos
+    num único lote, aproveitando o processamento em lote do spaCy.
+    """
+    user_id = request.headers.get('X-User-Id')
+    if not user_id:
+        return jsonify({'message': 'Usuário não autenticado.'}), 401
+
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({'message': 'Nenhum arquivo enviado.'}), 400
+
+    if any(file.filename == '' or not file.filename.endswith('.pdf') for file in files):
+        return jsonify({'message': 'Todos os arquivos enviados devem ser PDF.'}), 400
+
+    tipo_analise = request.form.get('tipo_analise', 'padrao')
+
+    try:
+        lista_pdf = [file.stream for file in files]
+        future = _EXECUTOR.submit(extrair_dados_de_contratos_por_tipo, lista_pdf, tipo_analise)
+        resultados = future.result()
+
+        return jsonify({
+            'message': 'Dados extraídos com sucesso! Revise para salvar.',
+            'extractedData': [
+                {'filename': file.filename, 'data': dados}
+                for file, dados in zip(files, resultados)
+            ],
+        }), 200
+
+    except Exception as e:
+        print(f"[ERRO] Falha na rota /upload-batch: {e}")
+        return jsonify({'message': f'Erro ao processar os contratos: {str(e)}'}), 500
+
 # ==============================================================================
 # ROTA PARA GERAR NOVOS CONTRATOS (ATUALIZADA)
 # ==============================================================================
@@ -129,27 +194,43 @@ def _processar_e_enviar_contrato(dados: Dict[str, Any], formato: str):
     if formato == 'pdf':
         # --- NOVA LÓGICA DE GERAÇÃO DIRETA DE PDF ---
         print("[INFO] Gerando contrato em formato PDF via WeasyPrint...")
-        pdf_stream = gerar_contrato_pdf_direto(dados)
-        if not pdf_stream:
+        response = _gerar_e_enviar_arquivo_temporario(
+            gerar_contrato_pdf_direto, dados, f"{nome_base}.pdf", 'application/pdf'
+        )
+        if not response:
             return None, "Erro interno ao gerar o documento PDF."
-        
-        return send_file(
-            pdf_stream,
-            as_attachment=True,
-            download_name=f"{nome_base}.pdf",
-            mimetype='application/pdf'
-        ), None
+        return response, None
     
     else: # O padrão é 'docx'
         # --- LÓGICA DE GERAÇÃO DE DOCX ---
         print("[INFO] Gerando contrato em formato DOCX...")
-        doc_stream = gerar_contrato_docx(dados)
-        if not doc_stream:
+        response = _gerar_e_enviar_arquivo_temporario(
+            gerar_contrato_docx, dados, f"{nome_base}.docx",
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
+        if not response:
             return None, "Erro interno ao gerar o documento DOCX."
+        return response, None
+
+def _gerar_e_enviar_arquivo_temporario(gerador, dados: Dict[str, Any], download_name: str, mimetype: str):
+    """
+    Gera o documento num arquivo temporário da pasta de uploads e o envia pelo
+    caminho. Com um arquivo real em disco o servidor (ex: gunicorn) pode usar o
+    sendfile do sistema operacional em vez de copiar os bytes em Python.
+    Retorna None se o gerador falhar.
+    """
+    extensao = os.path.splitext(download_name)[1]
+    descritor, temp_filepath = tempfile.mkstemp(suffix=extensao, dir=current_app.config.get('UPLOAD_FOLDER'))
+    with os.fdopen(descritor, 'wb') as arquivo_temporario:
+        gerado = gerador(dados, arquivo_temporario)
+    if not gerado:
+        os.remove(temp_filepath)
+        return None
+
+    @after_this_request
+    def remove_file(response):
+        try: os.remove(temp_filepath)
+        except Exception as e: print(f"Erro ao remover arquivo temporário: {e}")
+        return response
 
-        return send_file(
-            doc_stream,
-            as_attachment=True,
-            download_name=f"{nome_base}.docx",
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        ), None
\ No newline at end of file
+    return send_file(temp_filepath, as_attachment=True, download_name=download_name, mimetype=mimetype)
@@ -211,8 +211,12 @@ def generate_delivery_report(pedido_id):
     temp_filepath = os.path.join(current_app.config.get('UPLOAD_FOLDER'), report_filename)
     
     try:
-        gerar_relatorio_entrega(dados_formatados, nome_arquivo=temp_filepath)
-        
+        with open(temp_filepath, 'wb') as arquivo_relatorio:
+            gerado = gerar_relatorio_entrega(dados_formatados, arquivo_relatorio)
+        if not gerado:
+            os.remove(temp_filepath)
+            return jsonify({'message': 'Erro interno ao gerar o comprovante.'}), 500
+
         @after_this_request
         def remove_file(response):
             try: os.remove(temp_filepath)